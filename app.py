@@ -41,13 +41,22 @@ import zipfile
 import time
 import threading
 import html
+import string
+import functools
+from collections import OrderedDict
 import uuid
+import hashlib
+import queue
 
 # === Third-party imports ===
 from flask import Flask, render_template, request, session, redirect, flash, Response, jsonify
 from flask_session import Session
 from werkzeug.utils import secure_filename
 import google.generativeai as genai
+import orjson
+
+# === Local imports ===
+from explain_cache import ExplanationCache, make_cache_key
 
 # === Flask App Configuration ===
 app = Flask(__name__)
@@ -64,20 +73,294 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
 # === Task Management (Background Processing) ===
-tasks = {}                      # In-memory mapping: task_id -> status/progress/data
-tasks_lock = threading.Lock()   # Lock to synchronize access to `tasks`
+MAX_TASKS = 512            # Most tasks kept; oldest finished ones are evicted to make room
+FINISHED_TASK_TTL = 3600   # Seconds a complete/failed task is kept around
+MAX_RUNNING_TASKS = 4      # Books processed at once; further tasks wait in the queue
+
+
+class _TaskEntry:
+    """A task's fields plus the lock that guards them."""
+
+    __slots__ = ("lock", "fields", "last_used")
+
+    def __init__(self, fields):
+        self.lock = threading.Lock()
+        self.fields = fields
+        self.last_used = time.time()   # last read or write
+
+
+class TaskStore:
+    """
+    Bounded in-memory mapping: task_id -> status/progress/data.
+
+    - Entries are kept in least-recently-used order; reads and writes both count as use.
+    - Holds at most `max_tasks` entries, evicting the least recently used finished tasks first.
+      Pending/processing tasks are never evicted; when every entry is still
+      running, new tasks are refused instead.
+    - Finished tasks not read or written for `ttl` seconds are evicted whenever a new task is added.
+    - Each entry has its own lock, so a worker's progress updates don't
+      contend with status polls for other tasks; the store lock only guards
+      the mapping itself.
+    """
+
+    FINISHED_STATUSES = ("complete", "failed")
+
+    def __init__(self, max_tasks=MAX_TASKS, ttl=FINISHED_TASK_TTL):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, task_id, **fields):
+        """
+        Register (or replace) a task with the given fields.
+        Returns False (and stores nothing) if the store is full of unfinished tasks.
+        """
+        with self._lock:
+            self._evict()
+            if task_id not in self._tasks and len(self._tasks) >= self.max_tasks:
+                return False
+            self._tasks[task_id] = _TaskEntry(fields)
+            self._tasks.move_to_end(task_id)
+            return True
+
+    def update(self, task_id, **fields):
+        """Update an existing task's fields; unknown (e.g. evicted) tasks are ignored."""
+        entry = self._touch(task_id)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.fields.update(fields)
+
+    def get(self, task_id):
+        """Return a snapshot of the task's fields, or {} if it doesn't exist."""
+        entry = self._touch(task_id)
+        if entry is None:
+            return {}
+        with entry.lock:
+            return dict(entry.fields)
+
+    def pop(self, task_id):
+        """Remove a task and return its fields (or {} if it doesn't exist)."""
+        with self._lock:
+            entry = self._tasks.pop(task_id, None)
+        return entry.fields if entry is not None else {}
+
+    def _touch(self, task_id):
+        """Mark a task as just used (refreshing its TTL and LRU position) and return its entry."""
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is not None:
+                entry.last_used = time.time()
+                self._tasks.move_to_end(task_id)
+        return entry
+
+    def _evict(self):
+        """
+        Drop expired finished tasks, then the least recently used finished ones until there
+        is room for one more task. Unfinished tasks are left alone. Caller holds `_lock`.
+        """
+        cutoff = time.time() - self.ttl
+        finished = [
+            task_id for task_id, entry in self._tasks.items()
+            if entry.fields.get("status") in self.FINISHED_STATUSES
+        ]
+        for task_id in finished:  # least recently used first
+            if self._tasks[task_id].last_used < cutoff or len(self._tasks) >= self.max_tasks:
+                del self._tasks[task_id]
+
+
+tasks = TaskStore()
+task_queue = queue.Queue()   # (task_id, session_data) pairs drained by the task workers below
+
+# === Explanation Settings ===
+EXPLANATION_MODEL = "models/gemini-1.5-pro"
+EXPLANATION_FALLBACK = "[Could not get an explanation.]"
+EXPLANATION_MAX_TOKENS = 512  # Output cap per paragraph explanation
+EXPLANATION_WORKERS = 8   # Concurrent Gemini requests per book
+
+
+def _positive_int_setting(name, default):
+    """Read an integer >= 1 from the environment, failing fast at startup on bad values."""
+    raw = os.environ.get(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise RuntimeError(f"{name} must be a whole number >= 1 (got {raw!r})")
+    return value
+
+
+GEMINI_RPM = _positive_int_setting("GEMINI_RPM", 60)  # Requests per minute allowed per API key
+explanation_cache = ExplanationCache()  # Persistent paragraph -> explanation store
+
+# === API Key Validation Cache ===
+API_KEY_VALIDATION_TTL = 3600      # Seconds a successfully validated key is trusted
+_validated_keys = {}               # sha256(api_key) -> expiry timestamp (raw keys are never stored)
+_validated_keys_lock = threading.Lock()
+
+# === Precompiled patterns ===
+_CHAPTER_RE = re.compile(r"\{-(.+?)-\}")                                       # { - Chapter Title - }
+_IMAGE_RE = re.compile(r"\[IMAGE:\s*(https?://[^\s\]]+)\s*\]", re.IGNORECASE)  # [IMAGE: https://...]
+
+
+class _SlugTable(dict):
+    """
+    str.translate table for slugify: keeps [a-z0-9], maps whitespace and
+    hyphens to "_" and drops everything else. Entries are filled lazily so
+    non-ASCII characters are classified on first sight and then cached.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if char in string.ascii_lowercase or char in string.digits:
+            value = codepoint
+        elif char == "-" or char.isspace():
+            value = ord("_")
+        else:
+            value = None
+        self[codepoint] = value
+        return value
+
+
+_SLUG_TABLE = _SlugTable()
+
+# Memoized html.escape for short, repeated strings (chapter titles).
+# Paragraph bodies are unique and long, so they use plain html.escape.
+_html_escape = functools.lru_cache(maxsize=2048)(html.escape)
 
 
 # === Helper functions ===
+@functools.lru_cache(maxsize=1024)
 def slugify(text):
     """
     Convert a string into a URL/ID-friendly slug.
     Example: "Chapter 1: The Beginning?" -> "chapter_1_the_beginning"
+    Results are memoized: the same few chapter titles are slugified by the
+    reader TOC and by both zip export passes.
     """
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9\s-]", "", text)      # remove non-alphanumeric
-    text = re.sub(r"[\s-]+", "_", text).strip("_")  # replace spaces/hyphens with underscore
-    return text
+    text = text.lower().translate(_SLUG_TABLE)  # drop non-alphanumeric, spaces/hyphens -> "_"
+    while "__" in text:                         # collapse runs of separators
+        text = text.replace("__", "_")
+    return text.strip("_")
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+    Holds up to `rpm` tokens, refilled continuously at `rpm` per minute;
+    `acquire()` only sleeps when the bucket is empty.
+    """
+
+    def __init__(self, rpm):
+        if rpm < 1:
+            raise ValueError(f"rpm must be at least 1 (got {rpm})")
+        self.capacity = float(rpm)
+        self.rate = rpm / 60.0          # tokens per second
+        self.tokens = float(rpm)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def is_idle(self):
+        """True once the bucket has refilled completely, i.e. it's as good as a fresh one."""
+        with self.lock:
+            return time.monotonic() - self.updated >= 60.0
+
+
+_rate_limiters = {}                  # sha256(api_key) -> TokenBucket shared by all of that key's tasks
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key):
+    """Return the token bucket for `api_key`, creating it on first use (quotas are per key)."""
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key_hash)
+        if limiter is None:
+            # Drop buckets that have fully refilled so the dict doesn't grow for the life of the process
+            for idle_hash in [h for h, bucket in _rate_limiters.items() if bucket.is_idle()]:
+                del _rate_limiters[idle_hash]
+            limiter = _rate_limiters[key_hash] = TokenBucket(rpm=GEMINI_RPM)
+        return limiter
+
+
+def iter_unordered(func, items, max_workers):
+    """
+    Call `func(item)` for every item on up to `max_workers` daemon threads and
+    yield (item, result) pairs as they complete. An exception raised by
+    `func` is re-raised here.
+
+    Daemon threads (rather than a ThreadPoolExecutor, whose workers are joined
+    at interpreter exit) so shutting the server down never waits for
+    outstanding API calls. Once the consumer stops iterating (finishes,
+    raises or is closed), workers stop picking up new items.
+    """
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    total = pending.qsize()
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results.put((item, func(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+
+    for _ in range(min(max_workers, total)):
+        threading.Thread(target=worker, daemon=True).start()
+
+    try:
+        for _ in range(total):
+            item, result, error = results.get()
+            if error is not None:
+                raise error
+            yield item, result
+    finally:
+        stop.set()
+
+
+def _iter_blocks(filepath):
+    """
+    Yield the trimmed, non-empty paragraph blocks of a text file one at a time.
+    Blocks are separated by empty lines; the file is read line by line so
+    only the current block is ever held in memory.
+    """
+    with open(filepath, "r", encoding="utf-8") as fh:  # universal newlines: "\r\n"/"\r" -> "\n"
+        buf = []
+        for line in fh:
+            line = line.rstrip("\n")
+            if line:
+                buf.append(line)
+            elif buf:
+                block = "\n".join(buf).strip()
+                buf = []
+                if block:
+                    yield block
+        if buf:
+            block = "\n".join(buf).strip()
+            if block:
+                yield block
 
 
 def convert_txt_to_dict(filepath):
@@ -87,36 +370,26 @@ def convert_txt_to_dict(filepath):
 
     Rules:
     - Paragraphs separated by blank lines.
-    - Chapter markers: { - Chapter Title - }  (e.g. "{-Chapter 1-}")
-    - Image markers: [IMAGE: https://example.com/image.jpg]
+    - Chapter markers (at the start of a paragraph): { - Chapter Title - }  (e.g. "{-Chapter 1-}")
+    - Image markers (at the start of a paragraph): [IMAGE: https://example.com/image.jpg]
     """
     try:
-        with open(filepath, "r", encoding="utf-8") as fh:
-            content = fh.read().replace("\r\n", "\n").strip()
-
-        if not content:
-            return {}
-
-        # Split into blocks by blank lines, preserve trimmed blocks
-        blocks = [p.strip() for p in content.split("\n\n") if p.strip()]
-
         chapters = {"Introduction": []}
         current_chapter_title = "Introduction"
-
-        image_regex = r"\[IMAGE:\s*(https?://[^\s\]]+)\s*\]"
-        chapter_regex = r"\{-(.+?)-\}"
-
-        for block in blocks:
-            # Use search so leading/trailing whitespace doesn't prevent detection
-            chapter_match = re.search(chapter_regex, block)
-            image_match = re.search(image_regex, block, re.IGNORECASE)
-
-            if chapter_match:
+        has_content = False
+
+        # Blocks are streamed from disk rather than read and split all at once
+        for block in _iter_blocks(filepath):
+            has_content = True
+            # Markers start the (already trimmed) block, so a cheap prefix check
+            # keeps plain paragraphs from ever reaching the regex engine.
+            # "[" rather than "[IMAGE:" because image markers are case-insensitive.
+            if block.startswith("{-") and (chapter_match := _CHAPTER_RE.match(block)):
                 # start a new chapter
                 current_chapter_title = chapter_match.group(1).strip()
                 if current_chapter_title not in chapters:
                     chapters[current_chapter_title] = []
-            elif image_match:
+            elif block.startswith("[") and (image_match := _IMAGE_RE.match(block)):
                 # append image entry
                 chapters[current_chapter_title].append({
                     "type": "image",
@@ -129,6 +402,8 @@ def convert_txt_to_dict(filepath):
                     "content": block
                 })
 
+        if not has_content:
+            return {}
         return chapters
 
     except Exception as e:
@@ -137,68 +412,84 @@ def convert_txt_to_dict(filepath):
         return None
 
 
-def get_explanation(chat_session, paragraph, user_name):
+def get_explanation(model, paragraph, user_name):
     """
-    Send a single message to Gemini (via the given chat_session) to request
-    an explanation of the paragraph tailored to `user_name`.
+    Send a single stateless request to Gemini (via the given model) asking
+    for an explanation of the paragraph tailored to `user_name`.
+    No chat history is carried over, so each prompt only contains its own paragraph.
 
+    Rate limiting is the caller's job (see `TokenBucket`).
     Returns the explanation string; on failure returns a safe fallback.
     """
     try:
         # Prompting strategy is minimal here; consider improving for better results
-        response = chat_session.send_message(f'Explain this to {user_name}: "{paragraph}"')
-        explanation = response.text.strip()
-        # small buffer to avoid accidental rate spikes; adjust or remove in production
-        time.sleep(1.5)
-        return explanation
+        response = model.generate_content(
+            f'Explain this to {user_name}: "{paragraph}"',
+            generation_config={"max_output_tokens": EXPLANATION_MAX_TOKENS}
+        )
+        return response.text.strip()
     except Exception as e:
         print(f"API Error: {e}")
-        return "[Could not get an explanation.]"
+        return EXPLANATION_FALLBACK
 
 
-def create_book_zip(book_data, base_filename):
+def cached_get_explanation(paragraph, user_name, model_name, fetch):
     """
-    Build a zip archive (bytes) that contains:
-    - <base_filename>.html : The main annotated book with dark styling + TOC toggle
-    - book_requirements/exp_<n>.html : Individual explanation pages for each paragraph
+    Return the explanation for `paragraph` from `explanation_cache`, calling
+    `fetch()` (which performs the actual API request) only on a miss.
+    Failed requests are never cached so they are retried on the next run.
+    """
+    key = make_cache_key(paragraph, user_name, model_name)
+    explanation = explanation_cache.get(key)
+    if explanation is not None:
+        return explanation
+    if explanation_cache.policy == "replay":
+        return EXPLANATION_FALLBACK
 
-    `book_data` format:
-    { "Chapter Title": [ {type:'text', 'original':..., 'explanation':...}, {type:'image','url':...}, ... ], ... }
+    explanation = fetch()
+    if explanation != EXPLANATION_FALLBACK:
+        explanation_cache.put(key, explanation)
+    return explanation
+
+
+class StreamingBytesIO(io.RawIOBase):
     """
-    if isinstance(base_filename, tuple):
-        base_filename = base_filename[0]
+    Write-only, non-seekable buffer used to stream a zip archive.
 
-    zip_buffer = io.BytesIO()
+    `zipfile` falls back to its streaming mode (data descriptors instead of
+    seeking back to patch headers) when `tell()` is unsupported, so the bytes
+    written so far can be handed out and dropped with `read_and_clear()`.
+    """
 
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        main_html_content = ""
-        para_id = 0
-        explanation_folder = "book_requirements"
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
 
-        # Build TOC HTML
-        toc_html = "<h3>Table of Contents</h3><ul>"
-        for chapter_title in book_data.keys():
-            chapter_id = slugify(chapter_title)
-            toc_html += f'<li><a href="#{chapter_id}">{html.escape(chapter_title)}</a></li>'
-        toc_html += "</ul>"
+    def writable(self):
+        return True
 
-        # Build main content and per-paragraph explanation files
-        for chapter_title, content_items in book_data.items():
-            chapter_id = slugify(chapter_title)
-            main_html_content += f"<h2 class='chapter-title' id='{chapter_id}'>{html.escape(chapter_title)}</h2>\n"
+    def seekable(self):
+        return False
 
-            for item in content_items:
-                if item.get("type") == "text":
-                    explanation_path = f"{explanation_folder}/exp_{para_id}.html"
-                    # Main page paragraph with link to explanation
-                    main_html_content += f"""
-                        <div class="paragraph-container">
-                            <p>{html.escape(item.get('original',''))}</p>
-                            <a href="{explanation_path}" target="_blank" class="explain-button" aria-label="Explain paragraph">?</a>
-                        </div>
-                    """
-                    # Individual explanation HTML
-                    explanation_html = f"""<!DOCTYPE html>
+    def tell(self):
+        raise io.UnsupportedOperation("tell")
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def read_and_clear(self):
+        """Return everything written since the last call and empty the buffer."""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+# === Zip Export Templates ===
+# Filled with str.format, so literal CSS/JS braces are doubled.
+
+# Individual explanation page; `body` is already escaped and split into <p> tags
+_EXPLANATION_HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
@@ -216,26 +507,19 @@ def create_book_zip(book_data, base_filename):
 </head>
 <body>
   <div class="card">
-    <p>{html.escape(item.get('explanation','')).replace(chr(10), '</p><p>')}</p>
+    <p>{body}</p>
   </div>
 </body>
 </html>
 """
-                    # Write to zip
-                    zip_file.writestr(explanation_path, explanation_html)
-                    para_id += 1
-
-                elif item.get("type") == "image":
-                    # Insert the remote image (URL) into the main page
-                    main_html_content += f'<div class="image-container"><img src="{html.escape(item.get("url",""))}" alt="Embedded image"></div>\n'
 
-        # Main book HTML with TOC toggle button and styling
-        book_html_template = f"""<!DOCTYPE html>
+# Main book page with TOC toggle button and styling
+_BOOK_HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width,initial-scale=1">
-  <title>{html.escape(base_filename.replace('_',' ').title())}</title>
+  <title>{title}</title>
   <link rel="preconnect" href="https://fonts.googleapis.com">
   <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
   <link href="https://fonts.googleapis.com/css2?family=Merriweather:ital,wght@0,400;0,700;1,400&display=swap" rel="stylesheet">
@@ -266,7 +550,7 @@ def create_book_zip(book_data, base_filename):
   <button id="toc-toggle-btn" aria-expanded="false">Contents</button>
   <div id="toc-sidebar">{toc_html}</div>
 
-  <h1 class="main-title">{html.escape(base_filename.replace('_',' ').title())}</h1>
+  <h1 class="main-title">{title}</h1>
 
   {main_html_content}
 
@@ -294,10 +578,99 @@ def create_book_zip(book_data, base_filename):
 </body>
 </html>
 """
-        zip_file.writestr(f"{base_filename}.html", book_html_template)
 
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+
+def iter_book_zip(book_data, base_filename):
+    """
+    Stream a zip archive (as byte chunks) that contains:
+    - <base_filename>.html : The main annotated book with dark styling + TOC toggle
+    - book_requirements/exp_<n>.html : Individual explanation pages for each paragraph
+
+    `book_data` format:
+    { "Chapter Title": [ {type:'text', 'original':..., 'explanation':...}, {type:'image','url':...}, ... ], ... }
+    """
+    if isinstance(base_filename, tuple):
+        base_filename = base_filename[0]
+
+    zip_buffer = StreamingBytesIO()
+
+    # Fastest deflate level: the HTML is highly repetitive, so level 1 keeps most
+    # of the size reduction at a fraction of the default level's CPU cost
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zip_file:
+        main_parts = []
+        para_id = 0
+        explanation_folder = "book_requirements"
+
+        toc_parts = ["<h3>Table of Contents</h3><ul>"]
+
+        # Build TOC, main content and per-paragraph explanation files in one pass
+        for chapter_title, content_items in book_data.items():
+            chapter_id = slugify(chapter_title)
+            toc_parts.append(f'<li><a href="#{chapter_id}">{_html_escape(chapter_title)}</a></li>')
+            main_parts.append(f"<h2 class='chapter-title' id='{chapter_id}'>{_html_escape(chapter_title)}</h2>\n")
+
+            for item in content_items:
+                if item.get("type") == "text":
+                    explanation_path = f"{explanation_folder}/exp_{para_id}.html"
+                    # Main page paragraph with link to explanation
+                    main_parts.append(f"""
+                        <div class="paragraph-container">
+                            <p>{html.escape(item.get('original',''))}</p>
+                            <a href="{explanation_path}" target="_blank" class="explain-button" aria-label="Explain paragraph">?</a>
+                        </div>
+                    """)
+                    # Individual explanation page, written straight to the zip
+                    body = html.escape(item.get("explanation", "")).replace("\n", "</p><p>")
+                    zip_file.writestr(explanation_path, _EXPLANATION_HTML_TEMPLATE.format(body=body))
+                    yield zip_buffer.read_and_clear()
+                    para_id += 1
+
+                elif item.get("type") == "image":
+                    # Insert the remote image (URL) into the main page
+                    main_parts.append(f'<div class="image-container"><img src="{html.escape(item.get("url",""))}" alt="Embedded image"></div>\n')
+
+        toc_parts.append("</ul>")
+        toc_html = "".join(toc_parts)
+        main_html_content = "".join(main_parts)
+
+        # Main book HTML (TOC sidebar + content)
+        book_html = _BOOK_HTML_TEMPLATE.format(
+            title=html.escape(base_filename.replace("_", " ").title()),
+            toc_html=toc_html,
+            main_html_content=main_html_content
+        )
+        zip_file.writestr(f"{base_filename}.html", book_html)
+        yield zip_buffer.read_and_clear()
+
+    # Central directory / end-of-archive record written on close
+    yield zip_buffer.read_and_clear()
+
+
+def run_queued_task(task_id, session_data):
+    """
+    Queue entry point: run the background task and mark it failed on any
+    uncaught error (otherwise the task would stay pending forever and the
+    exception would kill the worker thread).
+    """
+    try:
+        background_explanation_task(task_id, session_data)
+    except Exception as e:
+        print(f"Task {task_id} crashed: {e}")
+        tasks.update(task_id, status="failed", message=f"Unexpected error: {e}")
+
+
+def _task_worker():
+    """Process queued tasks one at a time, forever."""
+    while True:
+        task_id, session_data = task_queue.get()
+        run_queued_task(task_id, session_data)
+        task_queue.task_done()
+
+
+# Fixed pool of daemon workers: at most MAX_RUNNING_TASKS books run at once, and
+# (like the original per-task daemon threads) they never block interpreter shutdown
+for worker_number in range(MAX_RUNNING_TASKS):
+    threading.Thread(target=_task_worker, name=f"clarifai-task-{worker_number}", daemon=True).start()
 
 
 def background_explanation_task(task_id, session_data):
@@ -305,20 +678,14 @@ def background_explanation_task(task_id, session_data):
     Background worker to:
     - parse uploaded file,
     - call the generative AI for each paragraph,
-    - update task progress in the global tasks dict.
+    - update task progress in the global task store.
     """
     filepath = session_data.get("filepath")
     user_name = session_data.get("user_name")
     api_key = session_data.get("api_key")
 
     def update_status(status, progress=None, message=None, data=None):
-        with tasks_lock:
-            tasks[task_id].update({
-                "status": status,
-                "progress": progress,
-                "message": message,
-                "data": data
-            })
+        tasks.update(task_id, status=status, progress=progress, message=message, data=data)
 
     # Convert file to structured book dict
     initial_book_data = convert_txt_to_dict(filepath)
@@ -326,10 +693,15 @@ def background_explanation_task(task_id, session_data):
         update_status("failed", message="Failed to parse book file.")
         return
 
-    # Count paragraphs to compute progress
-    total_paragraphs = sum(
-        1 for items in initial_book_data.values() for item in items if item.get("type") == "text"
-    )
+    # Flat work plan of (chapter_title, item_index, content) for every text item;
+    # initial_book_data stays untouched as the skeleton to splice results into
+    plan = [
+        (chapter_title, index, item.get("content", ""))
+        for chapter_title, content_items in initial_book_data.items()
+        for index, item in enumerate(content_items)
+        if item.get("type") == "text"
+    ]
+    total_paragraphs = len(plan)
     if total_paragraphs == 0:
         update_status("complete", progress=100, data=initial_book_data)
         return
@@ -337,31 +709,44 @@ def background_explanation_task(task_id, session_data):
     # Configure GenAI client and model
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("models/gemini-1.5-pro")
+        model = genai.GenerativeModel(EXPLANATION_MODEL)
     except Exception as e:
         update_status("failed", message=f"API Configuration Error: {e}")
         return
 
-    enriched_book_data = {}
+    rate_limiter = get_rate_limiter(api_key)
+
+    def explain(plan_item):
+        _, _, paragraph = plan_item
+
+        def fetch():
+            rate_limiter.acquire()
+            return get_explanation(model, paragraph, user_name)
+        return cached_get_explanation(paragraph, user_name, EXPLANATION_MODEL, fetch)
+
+    explanations = {}   # (chapter_title, item_index) -> explanation
     paragraphs_processed = 0
 
-    for chapter_title, content_items in initial_book_data.items():
-        enriched_book_data[chapter_title] = []
-        chat = model.start_chat()
-        for item in content_items:
-            if item.get("type") == "text":
-                explanation = get_explanation(chat, item.get("content", ""), user_name)
-                enriched_book_data[chapter_title].append({
-                    "type": "text",
-                    "original": item.get("content", ""),
-                    "explanation": explanation
-                })
-                paragraphs_processed += 1
-                # Update progress (integer percentage)
-                update_status("processing", progress=int((paragraphs_processed / total_paragraphs) * 100))
-            else:
-                # for images and other items, preserve as-is
-                enriched_book_data[chapter_title].append(item)
+    # Gemini calls are I/O bound, so dispatch all paragraphs to worker threads
+    for (chapter_title, index, _), explanation in iter_unordered(explain, plan, EXPLANATION_WORKERS):
+        explanations[(chapter_title, index)] = explanation
+        paragraphs_processed += 1
+        # Update progress (integer percentage)
+        update_status("processing", progress=int((paragraphs_processed / total_paragraphs) * 100))
+
+    # Splice explanations back into the skeleton in one pass;
+    # images and other items are preserved as-is
+    enriched_book_data = {
+        chapter_title: [
+            {
+                "type": "text",
+                "original": item.get("content", ""),
+                "explanation": explanations[(chapter_title, index)]
+            } if item.get("type") == "text" else item
+            for index, item in enumerate(content_items)
+        ]
+        for chapter_title, content_items in initial_book_data.items()
+    }
 
     # Finalize
     update_status("complete", progress=100, data=enriched_book_data)
@@ -405,13 +790,25 @@ def upload():
         return redirect("/upload_page")
 
     # Minimal validation of the API key (small API call). Keep this light to avoid costs.
-    try:
-        genai.configure(api_key=api_key)
-        # A tiny request to validate credentials — adjust if you have a dedicated endpoint for validation
-        genai.GenerativeModel("models/gemini-1.5-flash").generate_content("Hello", generation_config={"max_output_tokens": 1})
-    except Exception as e:
-        flash(f"API Key Error: {e}")
-        return redirect("/upload_page")
+    # Keys validated recently are trusted without another round-trip.
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    with _validated_keys_lock:
+        key_is_validated = _validated_keys.get(key_hash, 0) > time.time()
+
+    if not key_is_validated:
+        try:
+            genai.configure(api_key=api_key)
+            # A tiny request to validate credentials — adjust if you have a dedicated endpoint for validation
+            genai.GenerativeModel("models/gemini-1.5-flash").generate_content("Hello", generation_config={"max_output_tokens": 1})
+        except Exception as e:
+            flash(f"API Key Error: {e}")
+            return redirect("/upload_page")
+        with _validated_keys_lock:
+            now = time.time()
+            # Prune expired hashes so the dict doesn't grow for the life of the process
+            for expired_hash in [h for h, expiry in _validated_keys.items() if expiry <= now]:
+                del _validated_keys[expired_hash]
+            _validated_keys[key_hash] = now + API_KEY_VALIDATION_TTL
 
     # Save file
     filename = secure_filename(file.filename)
@@ -437,32 +834,32 @@ def process():
 
 @app.route("/start-task", methods=["POST"])
 def start_task():
-    """Start the background worker thread and return immediately (202)."""
+    """Queue the background task and return immediately (202); it stays "pending" until a worker picks it up."""
     task_id = str(uuid.uuid4())
+    if not tasks.set(task_id, status="pending", progress=0):
+        return jsonify({"message": "Too many books are being processed. Please try again later."}), 503
     session["task_id"] = task_id
-    with tasks_lock:
-        tasks[task_id] = {"status": "pending", "progress": 0}
 
-    # Use a copy of session data so thread sees needed values
-    thread = threading.Thread(target=background_explanation_task, args=(task_id, session.copy()))
-    thread.daemon = True
-    thread.start()
+    # Use a copy of session data so the worker sees needed values
+    task_queue.put((task_id, session.copy()))
     return jsonify({"message": "Task started."}), 202
 
 
 @app.route("/task-status")
 def task_status():
-    """Return JSON describing the current task's status and progress."""
+    """
+    Return JSON describing the current task's status and progress.
+    Polled continuously by the processing page, so it's encoded with orjson.
+    """
     task_id = session.get("task_id")
     if not task_id:
-        return jsonify({"status": "not_found"})
-    with tasks_lock:
-        task = tasks.get(task_id, {})
-    return jsonify({
+        return Response(orjson.dumps({"status": "not_found"}), mimetype="application/json")
+    task = tasks.get(task_id)
+    return Response(orjson.dumps({
         "status": task.get("status"),
         "progress": task.get("progress"),
         "message": task.get("message")
-    })
+    }), mimetype="application/json")
 
 
 @app.route("/read")
@@ -475,16 +872,14 @@ def read():
     if not task_id:
         return redirect("/")
 
-    with tasks_lock:
-        task = tasks.get(task_id, {})
+    task = tasks.get(task_id)
 
     if task.get("status") != "complete":
         flash("Processing is not complete or an error occurred.")
         return redirect("/")
 
-    # store the book_data in session for download route, and render read template
+    # book_data stays in `tasks` (the download route reads it from there)
     book_data = task.get("data", {})
-    session["book_data"] = book_data
 
     # Build chapter list with slug IDs for client-side TOC
     chapters_with_ids = [{"title": title, "id": slugify(title)} for title in book_data.keys()]
@@ -495,15 +890,17 @@ def read():
 @app.route("/download")
 def download():
     """
-    Create the annotated book zip and send it as a file download.
-    Also clean up the uploaded file and clear the session.
+    Stream the annotated book zip as a file download.
+    Also clean up the uploaded file, drop the finished task and clear the session.
     """
-    book_data = session.get("book_data")
+    task_id = session.get("task_id")
+    task = tasks.get(task_id)
+    book_data = task.get("data") if task.get("status") == "complete" else None
     if not book_data:
         flash("Could not find book data for download. Please try the process again.")
         return redirect("/")
 
-    zip_data = create_book_zip(book_data, session.get("filename", "annotated_book"))
+    zip_stream = iter_book_zip(book_data, session.get("filename", "annotated_book"))
     download_filename = f"{session.get('filename', 'annotated_book')}_annotated.zip"
 
     # Remove the uploaded file (cleanup)
@@ -513,10 +910,11 @@ def download():
         except Exception:
             pass
 
-    # Clear session after preparing download
+    # Free the task's book data (the zip stream holds its own reference) and clear session
+    tasks.pop(task_id)
     session.clear()
 
-    return Response(zip_data, mimetype="application/zip", headers={"Content-disposition": f"attachment; filename={download_filename}"})
+    return Response(zip_stream, mimetype="application/zip", headers={"Content-disposition": f"attachment; filename={download_filename}"})
 
 
 # === Run the app ===
@@ -0,0 +1,94 @@
+"""
+===========================================================
+ ClarifAI - Paragraph Explanation Cache
+===========================================================
+
+Description:
+    Persistent, content-addressed cache for paragraph explanations, so that
+    re-processing a book (or books sharing boilerplate paragraphs) does not
+    pay for the same Gemini call twice.
+
+    Entries are keyed by SHA-256 of (model name, user name, paragraph) and
+    stored in a local SQLite database running in WAL mode, so background
+    workers can write while the web process reads.
+
+Cache policy (CLARIFAI_CACHE_POLICY environment variable):
+    - enabled   : serve hits, call the API on a miss and store the result (default)
+    - read-only : serve hits, call the API on a miss but never write
+    - replay    : serve hits only; misses are never sent to the API
+    - disabled  : bypass the cache entirely
+"""
+
+# === Standard library imports ===
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+# === Configuration ===
+CACHE_PATH = os.environ.get("CLARIFAI_CACHE_PATH", "explain_cache.sqlite3")
+CACHE_POLICY = os.environ.get("CLARIFAI_CACHE_POLICY", "enabled")
+CACHE_POLICIES = ("enabled", "read-only", "replay", "disabled")
+
+
+def make_cache_key(paragraph, user_name, model_name):
+    """Return the hex SHA-256 cache key for a paragraph explanation request."""
+    return hashlib.sha256(f"{model_name}|{user_name}|{paragraph}".encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """
+    SQLite-backed explanation store.
+
+    SQLite connections can't be shared across threads, so each thread
+    lazily opens its own connection to the same database file.
+    """
+
+    def __init__(self, path=CACHE_PATH, policy=CACHE_POLICY):
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"Unknown cache policy {policy!r}; expected one of {', '.join(CACHE_POLICIES)}")
+        self.path = path
+        self.policy = policy
+        self._local = threading.local()
+
+    def _connection(self):
+        """Return this thread's connection, creating the schema on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, explanation TEXT, created_at INTEGER)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return the cached explanation for `key`, or None on a miss."""
+        if self.policy == "disabled":
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT explanation FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            # A broken cache must never break processing; treat as a miss
+            print(f"Cache read error: {e}")
+            return None
+        return row[0] if row else None
+
+    def put(self, key, explanation):
+        """Store `explanation` under `key` (only when the policy allows writes)."""
+        if self.policy != "enabled":
+            return
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, explanation, created_at) VALUES (?, ?, ?)",
+                    (key, explanation, int(time.time()))
+                )
+        except sqlite3.Error as e:
+            print(f"Cache write error: {e}")